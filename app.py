@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-import pytz
 from pathlib import Path
+from zoneinfo import ZoneInfo
 
 st.set_page_config(
     page_title="African Cities Weather Dashboard",
@@ -11,20 +11,123 @@ st.set_page_config(
 )
 
 DATA_FILE = Path("weather_data.csv")
+SAST = ZoneInfo('Africa/Johannesburg')
+
+CITIES = ['Cape Town', 'Kigali', 'Kampala']
+COUNTRY_MAP = {'Cape Town': 'South Africa', 'Kigali': 'Rwanda', 'Kampala': 'Uganda'}
+
+def data_version():
+    """
+    Return the modification time of the CSV, or None if it does not exist yet.
+    Used as a cache key so cached frames are rebuilt only when the file changes.
+    """
+    if DATA_FILE.exists():
+        return DATA_FILE.stat().st_mtime
+    return None
 
 @st.cache_data
-def load_data():
+def load_data(version):
     """
-    Load weather data from CSV and convert timestamp column to datetime.
-    This function is cached, but a button can force a rerun to refresh data.
+    Load weather data from CSV, convert timestamp column to datetime and
+    derive each row's country from its city.
+    This function is cached per `version` (the CSV modification time), so a
+    rerun picks up new data without redoing the parse when nothing changed.
     """
     if DATA_FILE.exists():
-        df = pd.read_csv(DATA_FILE)
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
-        df['timestamp'] = df['timestamp'].dt.tz_localize('UTC')
+        df = pd.read_csv(
+            DATA_FILE,
+            usecols=['timestamp', 'city', 'temperature', 'humidity'],
+            dtype={
+                'timestamp': 'int64',
+                'city': pd.CategoricalDtype(CITIES),
+                'temperature': 'float64',
+                'humidity': 'uint8',
+            }
+        )
+        # Epoch seconds reinterpreted as datetime64[s] without a parsing pass
+        timestamps = df['timestamp'].to_numpy().view('datetime64[s]')
+        df['timestamp'] = pd.Series(timestamps, index=df.index).dt.tz_localize('UTC')
+        # Countries line up with the city categories, so reuse the city codes
+        df['country'] = pd.Categorical.from_codes(
+            df['city'].cat.codes, categories=[COUNTRY_MAP[city] for city in CITIES]
+        )
+        # The fetcher appends in time order, so this is cheap and lets callers
+        # read the latest rows from the end instead of sorting on every rerun.
+        df = df.sort_values('timestamp', kind='mergesort', ignore_index=True)
         return df
     return pd.DataFrame()
 
+@st.cache_data
+def prepare_data(version, use_sast):
+    """
+    Add the display-time column and aggregate hourly means.
+    Returns the display frame and the per-city hourly frame plotted by the
+    charts. Cached per data version and timezone choice, so widget
+    interactions only rebuild the charts instead of redoing the pandas work.
+    """
+    df = load_data(version)
+
+    if use_sast:
+        plot_timestamp = df['timestamp'].dt.tz_convert(SAST).dt.tz_localize(None)
+    else:
+        plot_timestamp = df['timestamp'].dt.tz_localize(None)
+
+    display_df = df.assign(plot_timestamp=plot_timestamp)
+
+    # Aggregate here rather than in Vega-Lite so the browser only plots points.
+    hourly_df = display_df.groupby(
+        ['city', 'country', display_df['plot_timestamp'].dt.floor('h')],
+        observed=True
+    )[['temperature', 'humidity']].mean().reset_index()
+
+    return display_df, hourly_df
+
+def hourly_line_chart(data, measure, y_title, tooltip_title, tooltip_format, interpolation_type, active_timezone_str):
+    """
+    Build the per-city hourly line chart for one measure column.
+    Both charts share this spec so only the y encoding and tooltip differ.
+    """
+    # Only the encoded columns are shipped to the browser with the chart.
+    chart_data = data[['plot_timestamp', 'city', 'country', measure]]
+
+    return alt.Chart(chart_data).mark_line(
+        interpolate=interpolation_type
+    ).encode(
+        x=alt.X('plot_timestamp:T', axis=alt.Axis(title=f'Time ({active_timezone_str})', format="%b %d, %H:00")),
+        y=alt.Y(f'{measure}:Q', title=y_title),
+        color=alt.Color('city:N', title='City'),
+        tooltip=[alt.Tooltip('plot_timestamp:T', title='Hour', format="%b %d, %H:00"),
+                 alt.Tooltip(f'{measure}:Q', title=tooltip_title, format=tooltip_format),
+                 alt.Tooltip('city:N', title='City'),
+                 alt.Tooltip('country:N', title='Country')]
+    ).properties(
+        height=400
+    ).interactive()
+
+@st.fragment
+def temperature_chart_section(hourly_df, interpolation_type, active_timezone_str):
+    """
+    Render the city selector and temperature chart as a fragment, so changing
+    the selected city reruns only this section rather than the whole script.
+    """
+    temp_selection_options = ['All'] + CITIES
+    selected_city_temp = st.selectbox(
+        "Select a city to view its temperature or choose 'All' to compare:",
+        options=temp_selection_options,
+        index=1 
+    )
+
+    if selected_city_temp == 'All':
+        chart_data = hourly_df
+    else:
+        chart_data = hourly_df[hourly_df['city'] == selected_city_temp]
+
+    temp_chart = hourly_line_chart(
+        chart_data, 'temperature', 'Temperature (°C)', 'Avg. Temp (°C)', '.1f',
+        interpolation_type, active_timezone_str
+    )
+    st.altair_chart(temp_chart, use_container_width=True)
+
 st.title("Hourly Weather Dashboard for African Cities")
 st.markdown("This dashboard visualizes the latest hourly temperature and humidity data for Cape Town, Kigali, and Kampala. The data is updated every hour.")
 
@@ -32,85 +135,35 @@ if st.button('Refresh Data'):
     st.cache_data.clear()
     st.rerun()
 
-data_df = load_data()
+version = data_version()
+data_df = load_data(version)
 
 if data_df.empty:
     st.warning("No weather data available. Make sure `weather_data.csv` is in the repository and the fetching script has run.")
 else:
-    country_map = {'Cape Town': 'South Africa', 'Kigali': 'Rwanda', 'Kampala': 'Uganda'}
-    data_df['country'] = data_df['city'].map(country_map)
-
     use_sast = st.toggle('Display time in SAST (UTC+2)', value=True)
+    active_timezone_str = "SAST" if use_sast else "UTC"
+
+    display_df, hourly_df = prepare_data(version, use_sast)
     
-    display_df = data_df.copy()
-    active_timezone_str = "UTC"
-    
-    if use_sast:
-        sast_tz = pytz.timezone('Africa/Johannesburg')
-        display_df['plot_timestamp'] = display_df['timestamp'].dt.tz_convert(sast_tz).dt.tz_localize(None)
-        active_timezone_str = "SAST"
-    else:
-        display_df['plot_timestamp'] = display_df['timestamp'].dt.tz_localize(None)
-    
-    last_update_time = display_df['plot_timestamp'].max()
+    last_update_time = display_df['plot_timestamp'].iloc[-1]
     st.caption(f"Data last updated on: {last_update_time.strftime('%Y-%m-%d %H:%M:%S')} {active_timezone_str}")
 
-    cities = ['Cape Town', 'Kigali', 'Kampala']
-    
     smooth_lines = st.checkbox('Smooth lines', value=True)
     interpolation_type = 'monotone' if smooth_lines else 'linear'
 
     st.header("Temperature Chart")
     
-    temp_selection_options = ['All'] + cities
-    selected_city_temp = st.selectbox(
-        "Select a city to view its temperature or choose 'All' to compare:",
-        options=temp_selection_options,
-        index=1 
-    )
-    
-    if selected_city_temp == 'All':
-        chart_data = display_df
-    else:
-        chart_data = display_df[display_df['city'] == selected_city_temp]
-
-    temp_chart = alt.Chart(chart_data).mark_line(
-        interpolate=interpolation_type,
-        point=False
-    ).encode(
-        x=alt.X('yearmonthdatehours(plot_timestamp):T', 
-                axis=alt.Axis(title=f'Time ({active_timezone_str})', format="%b %d, %H:00")
-               ),
-        y=alt.Y('mean(temperature):Q', title='Temperature (°C)'),
-        color=alt.Color('city:N', title='City'),
-        tooltip=[alt.Tooltip('yearmonthdatehours(plot_timestamp):T', title='Hour'), 
-                 alt.Tooltip('mean(temperature):Q', title='Avg. Temp (°C)', format='.1f'), 
-                 alt.Tooltip('city:N', title='City'), 
-                 alt.Tooltip('country:N', title='Country')]
-    ).properties(
-        height=400
-    ).interactive()
-
-    st.altair_chart(temp_chart, use_container_width=True)
+    temperature_chart_section(hourly_df, interpolation_type, active_timezone_str)
 
     st.header("Humidity Chart")
     st.write("A chart showing humidity trends across Cape Town, Kigali, and Kampala.")
     
-    humidity_chart = alt.Chart(display_df).mark_line(
-        interpolate=interpolation_type
-    ).encode(
-        x=alt.X('yearmonthdatehours(plot_timestamp):T', axis=alt.Axis(title=f'Time ({active_timezone_str})', format="%b %d, %H:00")),
-        y=alt.Y('mean(humidity):Q', title='Humidity (%)'),
-        color=alt.Color('city:N', title='City'),
-        tooltip=[alt.Tooltip('yearmonthdatehours(plot_timestamp):T', title='Hour'),
-                 alt.Tooltip('mean(humidity):Q', title='Avg. Humidity (%)', format='.0f'),
-                 alt.Tooltip('city:N', title='City'), 
-                 alt.Tooltip('country:N', title='Country')]
-    ).properties(
-        height=400
-    ).interactive()
-
+    humidity_chart = hourly_line_chart(
+        hourly_df, 'humidity', 'Humidity (%)', 'Avg. Humidity (%)', '.0f',
+        interpolation_type, active_timezone_str
+    )
     st.altair_chart(humidity_chart, use_container_width=True)
 
     with st.expander("Show Raw Data"):
-        st.dataframe(display_df.sort_values('timestamp', ascending=False))
+        st.dataframe(display_df.iloc[::-1])
@@ -1,27 +1,90 @@
 import os
+import csv
 import time
+import logging
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import statistics
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 API_KEY = os.environ.get("OPENWEATHER_API_KEY")
 
 GEOCODING_API_URL = "http://api.openweathermap.org/geo/1.0/direct"
 TIMEMACHINE_API_URL = "https://api.openweathermap.org/data/3.0/onecall/timemachine"
 
 DATA_FILE = Path("weather_data.csv")
+CSV_FIELDS = ["timestamp", "city", "temperature", "humidity"]
+
+# Hourly rows are kept for this many days; older rows are compacted to one
+# daily mean per city so the file the dashboard parses stays bounded.
+RETENTION_DAYS = 30
+
+# Seconds to wait for the API to connect or respond before giving up
+REQUEST_TIMEOUT = 10
 
+# Shared across worker threads so connections to the API are kept alive and
+# reused. Requests are not paced up front; only rate-limit and server errors
+# back off, exponentially with jitter and honouring any Retry-After header.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        backoff_max=30,
+        backoff_jitter=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+    ),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+# Sent with every request, so per-call params only carry what varies
+SESSION.params = {"appid": API_KEY}
+
+# Coordinates are fixed, so they are stored here rather than geocoded every
+# run. Cities added without "lat"/"lon" fall back to the Geocoding API.
 CITIES = {
-    "Cape Town": {"country_code": "ZA"},
-    "Kigali": {"country_code": "RW"},
-    "Kampala": {"country_code": "UG"},
+    "Cape Town": {"country_code": "ZA", "lat": -33.9249, "lon": 18.4241},
+    "Kigali": {"country_code": "RW", "lat": -1.9441, "lon": 30.0619},
+    "Kampala": {"country_code": "UG", "lat": 0.3476, "lon": 32.5825},
 }
 
+def parse_json(response):
+    """
+    Parse a JSON API response, using orjson when it is installed.
+    
+    orjson parses the raw response bytes directly and is noticeably faster
+    than the standard library parser used by `response.json()`.
+    
+    Args:
+        response (requests.Response): Response whose body contains JSON
+    
+    Returns:
+        The decoded JSON document (typically a dict or list)
+    
+    Raises:
+        requests.exceptions.InvalidJSONError: If the body is not valid JSON
+    """
+    if orjson is None:
+        return response.json()
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
+        # Match response.json(), whose errors callers catch as RequestException
+        raise requests.exceptions.InvalidJSONError(str(e), response=response)
+
 def get_city_coordinates(city_name, country_code):
     """
     Fetch geographical coordinates (latitude and longitude) for a given city.
@@ -43,35 +106,35 @@ def get_city_coordinates(city_name, country_code):
     params = {
         "q": f"{city_name},{country_code}",
         "limit": 1,
-        "appid": API_KEY,
     }
     try:
-        response = requests.get(GEOCODING_API_URL, params=params)
+        response = SESSION.get(GEOCODING_API_URL, params=params, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        data = response.json()
+        data = parse_json(response)
         if data:
-            print(f"Coordinates for {city_name}: {data[0]['lat']}, {data[0]['lon']}")
+            logger.info("Coordinates for %s: %s, %s", city_name, data[0]["lat"], data[0]["lon"])
             return data[0]["lat"], data[0]["lon"]
         else:
-            print(f"Error: Could not find coordinates for {city_name}")
+            logger.error("Could not find coordinates for %s", city_name)
             return None, None
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching coordinates for {city_name}: {e}")
+        logger.error("Error fetching coordinates for %s: %s", city_name, e)
         return None, None
 
-def fetch_stable_weather_data(lat, lon, timestamp, attempts=3):
+def fetch_stable_weather_data(lat, lon, timestamp, attempts=1):
     """
-    Fetch weather data multiple times and return median values for stability.
+    Fetch weather data, optionally multiple times, and return median values.
     
-    This function performs multiple API calls to get consistent weather readings
-    by fetching data several times and calculating the median temperature and
-    humidity to reduce variability in the data.
+    The Time Machine API returns the same archived reading for a past hour,
+    so a single call is made by default. With more attempts, the data is
+    fetched several times and the median temperature and humidity are used
+    to reduce variability in the data.
     
     Args:
         lat (float): Latitude coordinate for the location
         lon (float): Longitude coordinate for the location
         timestamp (int): Unix timestamp for the specific hour to fetch data
-        attempts (int, optional): Number of API calls to make for stability. Defaults to 3.
+        attempts (int, optional): Number of API calls to make for stability. Defaults to 1.
     
     Returns:
         dict or None: Dictionary containing stable weather data with keys:
@@ -80,20 +143,27 @@ def fetch_stable_weather_data(lat, lon, timestamp, attempts=3):
                      - 'humidity': Median humidity percentage
                      Returns None if no valid data could be retrieved.
     """
+    if attempts == 1:
+        weather_data = fetch_hourly_weather_data(lat, lon, timestamp)
+        if not (weather_data and "data" in weather_data and weather_data["data"]):
+            return None
+        record = weather_data["data"][0]
+        return {
+            "timestamp": timestamp,
+            "temperature": record["temp"],
+            "humidity": record["humidity"],
+        }
+
     temperatures = []
     humidities = []
     
-    print(f"  > Performing {attempts} checks for a stable reading...")
-    for i in range(attempts):
+    logger.debug("Performing %s checks for a stable reading...", attempts)
+    for _ in range(attempts):
         weather_data = fetch_hourly_weather_data(lat, lon, timestamp)
         if weather_data and "data" in weather_data and weather_data["data"]:
             record = weather_data["data"][0]
             temperatures.append(record["temp"])
             humidities.append(record["humidity"])
-        
-        # Small delay between API calls
-        if i < attempts - 1:
-            time.sleep(0.5)
 
     if not temperatures or not humidities:
         return None
@@ -102,8 +172,8 @@ def fetch_stable_weather_data(lat, lon, timestamp, attempts=3):
     stable_temp = statistics.median(temperatures)
     stable_humidity = statistics.median(humidities)
 
-    print(f"  > Raw Temps: {temperatures}, Stable: {stable_temp}")
-    print(f"  > Raw Humidities: {humidities}, Stable: {stable_humidity}")
+    logger.debug("Raw Temps: %s, Stable: %s", temperatures, stable_temp)
+    logger.debug("Raw Humidities: %s, Stable: %s", humidities, stable_humidity)
 
     return {
         "timestamp": timestamp,
@@ -135,18 +205,120 @@ def fetch_hourly_weather_data(lat, lon, timestamp):
         "lon": lon,
         "dt": timestamp,
         "units": "metric",
-        "appid": API_KEY
     }
     try:
-        timestamp_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-        print(f"Fetching weather data for lat={lat}, lon={lon}, timestamp={timestamp_str}")
-        response = requests.get(TIMEMACHINE_API_URL, params=params)
+        logger.debug("Fetching weather data for lat=%s, lon=%s, timestamp=%s", lat, lon, timestamp)
+        response = SESSION.get(TIMEMACHINE_API_URL, params=params, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        return response.json()
+        return parse_json(response)
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching weather data for lat={lat}, lon={lon}: {e}")
+        logger.error("Error fetching weather data for lat=%s, lon=%s: %s", lat, lon, e)
         return None
 
+def fetch_city_weather(city_name, city_info, timestamp):
+    """
+    Fetch a stable weather record for a single city.
+    
+    Uses the city's configured coordinates, geocoding it only when they are
+    missing, and then retrieves the stable weather reading for the given hour.
+    Runs in a worker thread from `main`.
+    
+    Args:
+        city_name (str): Name of the city to fetch data for
+        city_info (dict): City configuration containing the 'country_code'
+                          and optionally 'lat' and 'lon'
+        timestamp (int): Unix timestamp for the specific hour to fetch data
+    
+    Returns:
+        dict or None: Dictionary with 'timestamp', 'city', 'temperature' and
+                     'humidity' keys, or None if no reading could be retrieved.
+    """
+    logger.info("Fetching data for %s...", city_name)
+    lat, lon = city_info.get("lat"), city_info.get("lon")
+    if lat is None or lon is None:
+        lat, lon = get_city_coordinates(city_name, city_info["country_code"])
+
+    if lat is None or lon is None:
+        logger.warning("Could not retrieve a stable reading for %s.", city_name)
+        return None
+
+    stable_record = fetch_stable_weather_data(lat, lon, timestamp)
+
+    if not stable_record:
+        logger.warning("Could not retrieve a stable reading for %s.", city_name)
+        return None
+
+    logger.info("Successfully fetched stable data for %s.", city_name)
+    return {
+        "timestamp": stable_record["timestamp"],
+        "city": city_name,
+        "temperature": stable_record["temperature"],
+        "humidity": stable_record["humidity"],
+    }
+
+def compact_data_file(now):
+    """
+    Deduplicate the CSV and downsample rows older than the retention window.
+    
+    Rows are deduplicated on (timestamp, city), keeping the last one written,
+    which covers workflow runs that overlap the same hour. Rows older than
+    RETENTION_DAYS (rounded down to a UTC day boundary) are replaced by one
+    row per city per day holding the daily mean, stamped at midnight UTC.
+    Already-compacted days pass through unchanged, so repeated runs are stable.
+    
+    Args:
+        now (int): Unix timestamp used as the reference for the retention window
+    
+    Returns:
+        int: Number of rows removed from the file
+    """
+    with DATA_FILE.open(newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    cutoff = now - RETENTION_DAYS * 86400
+    cutoff -= cutoff % 86400
+
+    latest = {}
+    for row in rows:
+        latest[(int(row["timestamp"]), row["city"])] = row
+
+    daily = {}
+    compacted = []
+    for (timestamp, city), row in latest.items():
+        if timestamp >= cutoff:
+            compacted.append(row)
+            continue
+        day = (timestamp - timestamp % 86400, city)
+        if day not in daily:
+            daily[day] = {"temperature": [], "humidity": []}
+            compacted.append(day)
+        daily[day]["temperature"].append(float(row["temperature"]))
+        daily[day]["humidity"].append(float(row["humidity"]))
+
+    if len(compacted) == len(rows):
+        return 0
+
+    # Replace the day keys with their aggregated rows, preserving file order
+    for i, entry in enumerate(compacted):
+        if isinstance(entry, tuple):
+            values = daily[entry]
+            compacted[i] = {
+                "timestamp": entry[0],
+                "city": entry[1],
+                "temperature": round(statistics.mean(values["temperature"]), 2),
+                "humidity": round(statistics.mean(values["humidity"])),
+            }
+    compacted.sort(key=lambda row: int(row["timestamp"]))
+
+    temp_file = DATA_FILE.with_suffix(".tmp")
+    with temp_file.open('w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(compacted)
+    temp_file.replace(DATA_FILE)
+
+    return len(rows) - len(compacted)
+
 def main():
     """
     Main function to fetch and store weather data for multiple cities.
@@ -154,9 +326,9 @@ def main():
     This function orchestrates the entire weather data collection process:
     1. Validates that the API key is configured
     2. Calculates the timestamp for the previous complete hour
-    3. Iterates through predefined cities to fetch their coordinates
-    4. Retrieves stable weather data for each city
-    5. Saves all collected data to a CSV file
+    3. Fetches coordinates and stable weather data for each city concurrently
+    4. Appends each city's record to the CSV file as soon as it is fetched
+    5. Deduplicates the file and compacts rows older than RETENTION_DAYS
     
     The function fetches weather data for the previous hour to ensure
     complete data availability. It handles both creating a new CSV file
@@ -165,8 +337,10 @@ def main():
     Raises:
         SystemExit: Implicitly exits if API_KEY is not configured
     """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
     if not API_KEY:
-        print("Error: OPENWEATHER_API_KEY environment variable not set.")
+        logger.error("OPENWEATHER_API_KEY environment variable not set.")
         return
 
     current_time = int(time.time())
@@ -174,42 +348,40 @@ def main():
 
     # format the timestamp to a readable format
     readable_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(previous_hour_timestamp))
-    print(f"Fetching data for {readable_time}...")
+    logger.info("Fetching data for %s...", readable_time)
 
-    all_weather_data = []
+    # The work is network-bound, so one thread per city overlaps the requests.
+    # Records are written as each city completes, so a failure later in the
+    # run does not lose readings that were already fetched.
+    file_exists = DATA_FILE.exists()
+    records_written = 0
+    with DATA_FILE.open('a', newline='') as f, ThreadPoolExecutor(max_workers=len(CITIES)) as executor:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, lineterminator='\n')
+        if not file_exists:
+            writer.writeheader()
 
-    for city_name, city_info in CITIES.items():
-        print(f"Fetching data for {city_name}...")
-        lat, lon = get_city_coordinates(city_name, city_info["country_code"])
+        futures = [
+            executor.submit(fetch_city_weather, city_name, city_info, previous_hour_timestamp)
+            for city_name, city_info in CITIES.items()
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            if record:
+                writer.writerow(record)
+                records_written += 1
 
-        if lat is not None and lon is not None:
-            stable_record = fetch_stable_weather_data(lat, lon, previous_hour_timestamp)
-
-        if stable_record:
-            all_weather_data.append({
-                "timestamp": stable_record["timestamp"],
-                "city": city_name,
-                "temperature": stable_record["temperature"],
-                "humidity": stable_record["humidity"],
-            })
-            print(f"Successfully fetched stable data for {city_name}.")
-        else:
-            print(f"Could not retrieve a stable reading for {city_name}.")
-        
-        time.sleep(1) 
-
-    if not all_weather_data:
-        print("No weather data was fetched.")
+    if not records_written:
+        logger.warning("No weather data was fetched.")
         return
 
-    new_data_df = pd.DataFrame(all_weather_data)
-
-    if DATA_FILE.exists():
-        new_data_df.to_csv(DATA_FILE, mode='a', header=False, index=False)
-        print(f"Appended {len(all_weather_data)} new records to {DATA_FILE}")
+    if file_exists:
+        logger.info("Appended %s new records to %s", records_written, DATA_FILE)
     else:
-        new_data_df.to_csv(DATA_FILE, mode='w', header=True, index=False)
-        print(f"Created {DATA_FILE} and wrote {len(all_weather_data)} new records.")
+        logger.info("Created %s and wrote %s new records.", DATA_FILE, records_written)
+
+    removed = compact_data_file(current_time)
+    if removed:
+        logger.info("Compacted %s: removed %s duplicate or downsampled records.", DATA_FILE, removed)
 
 if __name__ == "__main__":
     main()